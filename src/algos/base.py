@@ -1,7 +1,14 @@
 from abc import ABC, abstractmethod
+from itertools import combinations
+from typing import Any, Callable, Hashable, Iterable, Mapping
 
 
 class BaseSolution(ABC):
+    # value of the formula
+    value: int
+    # number of operations in the formula
+    num_steps: int
+
     @abstractmethod
     def explain(self, header: bool = True) -> list[str]: ...
 
@@ -9,8 +16,45 @@ class BaseSolution(ABC):
     def used_numbers(self) -> list[int]: ...
 
 
+# how many states are expanded between two deadline checks
+DEADLINE_CHECK_INTERVAL = 32
+
+
 class BaseSolver(ABC):
+    # False if the last call to generate_solutions was stopped by its deadline
+    exhausted: bool
+    # all solutions with at most this many steps have been generated
+    searched_steps: int
+
     @abstractmethod
     def generate_solutions(
-        self, inputs: list[BaseSolution]
-    ) -> dict[int, set[BaseSolution]]: ...
+        self, deadline: float | None = None
+    ) -> Mapping[int, set[BaseSolution]]:
+        """
+        Generate all solutions by value, stopping early once `time.perf_counter()` passes
+        `deadline`. The search is breadth-first: solutions with fewer steps are generated first.
+        """
+
+
+def distinct_pairs(
+    state: list[Any], key: Callable[[Any], Hashable]
+) -> Iterable[tuple[int, int]]:
+    """
+    Return the index pairs (i, j), i < j, of a state to expand, skipping pairs whose two
+    solutions are identical (same key) to those of an already expanded pair: they would
+    yield the same solutions and the same next states.
+    Keys are only computed when the state contains duplicate values.
+    """
+    n = len(state)
+    if len({s.value for s in state}) == n:
+        return combinations(range(n), 2)
+    keys = [key(s) for s in state]
+    pairs = []
+    seen = set()
+    for i, j in combinations(range(n), 2):
+        pair = (keys[i], keys[j])
+        if pair not in seen:
+            seen.add(pair)
+            seen.add((keys[j], keys[i]))
+            pairs.append((i, j))
+    return pairs
@@ -1,10 +1,10 @@
 from collections import defaultdict, deque
 from dataclasses import dataclass
-from itertools import combinations
 from operator import add, floordiv, mul, sub
+from time import perf_counter
 from typing import Any, Callable, Optional
 
-from algos.base import BaseSolution, BaseSolver
+from algos.base import DEADLINE_CHECK_INTERVAL, BaseSolution, BaseSolver, distinct_pairs
 
 """
 Define a tree-like type for formulas. In pseudo-Ocaml :
@@ -56,7 +56,7 @@ class Solution(BaseSolution):
     def explain(self, header: bool = True) -> list[str]:
         result = []
         if header:
-            result.append(f"{self.value} can be computed in {self.num_steps} steps")
+            result.append(f"{self.value} can be computed in {self.num_steps} steps:")
 
         match self.formula:
             case int():
@@ -98,18 +98,34 @@ class Solver(BaseSolver):
     def __init__(self, inputs: list[int]):
         self.numbers = [Solution(i) for i in inputs]
 
-    def generate_solutions(self) -> dict[int, set[Solution]]:
+    def generate_solutions(
+        self, deadline: float | None = None
+    ) -> dict[int, set[Solution]]:
         fifo = deque([self.numbers])
         solutions = defaultdict(set)
+        self.exhausted = True
+        self.searched_steps = len(self.numbers) - 1
+        expanded = 0
         while len(fifo) > 0:
             current = fifo.popleft()
             n = len(current)
+            if deadline is not None:
+                expanded += 1
+                if (
+                    expanded % DEADLINE_CHECK_INTERVAL == 0
+                    and perf_counter() > deadline
+                ):
+                    # states are expanded by depth, so all shallower states have been expanded
+                    self.exhausted = False
+                    self.searched_steps = len(self.numbers) - n
+                    break
             if n < 2:
                 continue  # not enough numbers in the candidate to do anything
 
             # For all pairs of numbers in the candidate list, pop them and replace them
-            # with the result of all possible operations between these numbers
-            for i, j in combinations(range(n), 2):
+            # with the result of all possible operations between these numbers.
+            # Pairs identical to an already expanded pair (e.g. two 25s) are skipped.
+            for i, j in distinct_pairs(current, lambda s: s.str_formula):
                 copy = current.copy()
                 # pop j first to avoid off-by-one issues (j > i)
                 right = copy.pop(j)
@@ -0,0 +1,243 @@
+from collections import deque
+from time import perf_counter
+from typing import Any, Iterator, Mapping, Optional
+
+from algos.base import DEADLINE_CHECK_INTERVAL, BaseSolution, BaseSolver
+
+"""
+Engine written for tracing JITs (PyPy): the hot loop only handles plain ints and lists of ints,
+with no closures, no `match` and no dispatch on the type of a formula.
+
+Formulas live in a flat, hash-consed node table: a node is an index into parallel lists, and
+identical formulas share the same index. A state of the search is a list of node indices.
+"""
+
+LEAF, ADD, MUL, SUB, DIV = -1, 0, 1, 2, 3
+SYMBOLS = ["+", "*", "-", "/"]
+
+
+class Nodes:
+    """Node table. Node i is either an input (op[i] == LEAF) or left[i] op[i] right[i]."""
+
+    def __init__(self) -> None:
+        self.value: list[int] = []
+        self.op: list[int] = []
+        self.left: list[int] = []
+        self.right: list[int] = []
+        self.steps: list[int] = []
+        self._solutions: list[Optional["Solution"]] = []
+
+    def add(self, value: int, op: int, left: int, right: int, steps: int) -> int:
+        self.value.append(value)
+        self.op.append(op)
+        self.left.append(left)
+        self.right.append(right)
+        self.steps.append(steps)
+        self._solutions.append(None)
+        return len(self.value) - 1
+
+    def solution(self, index: int) -> "Solution":
+        """Return the (unique) Solution object for a node, creating it on first use."""
+        solution = self._solutions[index]
+        if solution is None:
+            solution = self._solutions[index] = Solution(self, index)
+        return solution
+
+
+class Solution(BaseSolution):
+    __slots__ = ("nodes", "index", "value", "num_steps")
+
+    def __init__(self, nodes: Nodes, index: int):
+        self.nodes = nodes
+        self.index = index
+        self.value = nodes.value[index]
+        self.num_steps = nodes.steps[index]
+
+    def __hash__(self) -> int:
+        return self.index
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Solution):
+            return False
+        return self.nodes is other.nodes and self.index == other.index
+
+    @property
+    def formula(self) -> int | tuple["Solution", str, "Solution"]:
+        nodes = self.nodes
+        op = nodes.op[self.index]
+        if op == LEAF:
+            return self.value
+        left = nodes.solution(nodes.left[self.index])
+        right = nodes.solution(nodes.right[self.index])
+        return (left, SYMBOLS[op], right)
+
+    def __str__(self) -> str:
+        nodes = self.nodes
+        op = nodes.op[self.index]
+        if op == LEAF:
+            return str(self.value)
+        left = nodes.solution(nodes.left[self.index])
+        right = nodes.solution(nodes.right[self.index])
+        return f"({left}, {SYMBOLS[op]}, {right})"
+
+    def explain(self, header: bool = True) -> list[str]:
+        result = []
+        if header:
+            result.append(f"{self.value} can be computed in {self.num_steps} steps:")
+        self._explain_steps(self.index, result)
+        return result
+
+    def _explain_steps(self, index: int, result: list[str]) -> None:
+        nodes = self.nodes
+        op = nodes.op[index]
+        if op == LEAF:
+            return
+        left, right = nodes.left[index], nodes.right[index]
+        self._explain_steps(left, result)
+        self._explain_steps(right, result)
+        result.append(
+            f"{nodes.value[left]} {SYMBOLS[op]} {nodes.value[right]} = {nodes.value[index]}"
+        )
+
+    def used_numbers(self) -> list[int]:
+        nodes = self.nodes
+        used = []
+        stack = [self.index]
+        while stack:
+            index = stack.pop()
+            if nodes.op[index] == LEAF:
+                used.append(nodes.value[index])
+            else:
+                # right first, so that numbers are listed left to right
+                stack.append(nodes.right[index])
+                stack.append(nodes.left[index])
+        return used
+
+
+class LazySolutions(Mapping[int, set[Solution]]):
+    """
+    Solutions by value, whose Solution objects are only created when a value is read.
+    Returned when the search is stopped by its deadline, so that the caller doesn't pay
+    (after the deadline) for every solution found when it only reads a few values.
+    """
+
+    def __init__(self, nodes: Nodes, found: dict[int, set[int]]):
+        self.nodes = nodes
+        self.found = found
+        self._solutions: dict[int, set[Solution]] = {}
+
+    def __getitem__(self, value: int) -> set[Solution]:
+        solutions = self._solutions.get(value)
+        if solutions is None:
+            nodes = self.nodes
+            solutions = self._solutions[value] = {
+                nodes.solution(index) for index in self.found[value]
+            }
+        return solutions
+
+    def __contains__(self, value: object) -> bool:
+        return value in self.found
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.found)
+
+    def __len__(self) -> int:
+        return len(self.found)
+
+
+class Solver(BaseSolver):
+    def __init__(self, inputs: list[int]):
+        self.nodes = Nodes()
+        # identical inputs share a node
+        leaves: dict[int, int] = {}
+        self.numbers = []
+        for value in inputs:
+            if value not in leaves:
+                leaves[value] = self.nodes.add(value, LEAF, -1, -1, 0)
+            self.numbers.append(leaves[value])
+
+    def generate_solutions(
+        self, deadline: float | None = None
+    ) -> Mapping[int, set[Solution]]:
+        nodes = self.nodes
+        values = nodes.value
+        steps = nodes.steps
+        # (left << 32 | right) << 2 | op -> node index, so that each formula is only stored once
+        interned: dict[int, int] = {}
+        found: dict[int, set[int]] = {}
+        fifo = deque([self.numbers])
+        self.exhausted = True
+        self.searched_steps = len(self.numbers) - 1
+        expanded = 0
+        while fifo:
+            current = fifo.popleft()
+            n = len(current)
+            if deadline is not None:
+                expanded += 1
+                if (
+                    expanded % DEADLINE_CHECK_INTERVAL == 0
+                    and perf_counter() > deadline
+                ):
+                    # states are expanded by depth, so all shallower states have been expanded
+                    self.exhausted = False
+                    self.searched_steps = len(self.numbers) - n
+                    break
+            if n < 2:
+                continue  # not enough numbers in the candidate to do anything
+
+            # identical formulas have identical indices: only expand each pair of indices once
+            seen_pairs: set[int] | None = set() if len(set(current)) < n else None
+            for i in range(n - 1):
+                for j in range(i + 1, n):
+                    left = current[i]
+                    right = current[j]
+                    if seen_pairs is not None:
+                        pair = (left << 32) | right
+                        if pair in seen_pairs:
+                            continue
+                        seen_pairs.add(pair)
+                        seen_pairs.add((right << 32) | left)
+                    x = values[left]
+                    y = values[right]
+                    # ensure x >= y
+                    if x < y:
+                        left, right = right, left
+                        x, y = y, x
+                    rest = current[:i] + current[i + 1 : j] + current[j + 1 :]
+                    num_steps = 1 + steps[left] + steps[right]
+
+                    for op in range(4):
+                        if op == ADD:
+                            value = x + y
+                        elif op == MUL:
+                            if y <= 1:  # only multiply numbers > 1
+                                continue
+                            value = x * y
+                        elif op == SUB:
+                            if x == y:  # only substract different numbers
+                                continue
+                            value = x - y
+                        else:
+                            # divisor should be greater than 1 and evenly divide x
+                            if y <= 1 or x % y != 0:
+                                continue
+                            value = x // y
+
+                        key = (((left << 32) | right) << 2) | op
+                        index = interned.get(key, -1)
+                        if index < 0:
+                            index = nodes.add(value, op, left, right, num_steps)
+                            interned[key] = index
+                            if value in found:
+                                found[value].add(index)
+                            else:
+                                found[value] = {index}
+                        if n > 2:
+                            fifo.append(rest + [index])
+        if not self.exhausted:
+            return LazySolutions(nodes, found)
+        interned.clear()  # lower the peak memory before creating the Solution objects
+        return {
+            value: {nodes.solution(index) for index in indices}
+            for value, indices in found.items()
+        }
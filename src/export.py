@@ -0,0 +1,222 @@
+"""
+Bulk export of solutions, as plain text, JSON Lines or a compact binary encoding.
+
+Solutions produced by the engines share most of their subtrees, so every formula node
+is rendered once and the result is reused by every solution that contains it.
+Output is accumulated in chunks and written to a binary stream in a few large writes.
+
+Works with the solutions of every engine: nodes are either `Solution` objects with a
+`formula` attribute (v1, v2) or bare formulas, i.e. ints and (left, op, right) tuples (v3).
+"""
+
+from typing import Any, BinaryIO, Iterable, Iterator
+
+FORMATS = ("text", "jsonl", "binary")
+CHUNK_SIZE = 1024  # number of solutions rendered between two writes
+
+BINARY_MAGIC = b"SMLB\x01"
+OPERATORS = "+*-/"
+_LEAF, _NODE, _SOLUTION = 0, 1, 2
+SEPARATOR = "-" * 20 + "\n"
+
+
+def _formula(node: Any) -> Any:
+    return getattr(node, "formula", node)
+
+
+class TextRenderer:
+    """Render solutions as text, caching (value, num_steps, steps) for each node by identity."""
+
+    def __init__(self) -> None:
+        # id(node) -> (node, rendered); holding the node keeps its id() from being reused
+        self._cache: dict[int, tuple[Any, tuple[int, int, str]]] = {}
+
+    def _render(self, node: Any) -> tuple[int, int, str]:
+        cached = self._cache.get(id(node))
+        if cached is not None:
+            return cached[1]
+        formula = _formula(node)
+        if isinstance(formula, int):
+            rendered = (formula, 0, "")
+        else:
+            left, op, right = formula
+            left_value, left_steps, left_text = self._render(left)
+            right_value, right_steps, right_text = self._render(right)
+            value = _apply(op, left_value, right_value)
+            rendered = (
+                value,
+                1 + left_steps + right_steps,
+                f"{left_text}{right_text}{left_value} {op} {right_value} = {value}\n",
+            )
+        self._cache[id(node)] = (node, rendered)
+        return rendered
+
+    def __call__(self, solution: Any) -> str:
+        value, num_steps, text = self._render(solution)
+        return f"{value} can be computed in {num_steps} steps:\n{text}{SEPARATOR}"
+
+
+class JsonlRenderer:
+    """Render solutions as JSON objects, caching (value, num_steps, formula, steps) for each node."""
+
+    def __init__(self) -> None:
+        self._cache: dict[int, tuple[Any, tuple[int, int, str, str]]] = {}
+
+    def _render(self, node: Any) -> tuple[int, int, str, str]:
+        cached = self._cache.get(id(node))
+        if cached is not None:
+            return cached[1]
+        formula = _formula(node)
+        if isinstance(formula, int):
+            rendered = (formula, 0, str(formula), "")
+        else:
+            left, op, right = formula
+            left_value, left_steps, left_formula, left_json = self._render(left)
+            right_value, right_steps, right_formula, right_json = self._render(right)
+            value = _apply(op, left_value, right_value)
+            # steps only contain digits, operators and spaces: no JSON escaping needed
+            step = f'"{left_value} {op} {right_value} = {value}"'
+            rendered = (
+                value,
+                1 + left_steps + right_steps,
+                f"({left_formula}{op}{right_formula})",
+                ", ".join(filter(None, (left_json, right_json, step))),
+            )
+        self._cache[id(node)] = (node, rendered)
+        return rendered
+
+    def __call__(self, solution: Any) -> str:
+        value, num_steps, formula, steps = self._render(solution)
+        return (
+            f'{{"value": {value}, "num_steps": {num_steps}, '
+            f'"formula": "{formula}", "steps": [{steps}]}}\n'
+        )
+
+
+def _apply(op: str, left: int, right: int) -> int:
+    if op == "+":
+        return left + right
+    if op == "-":
+        return left - right
+    if op == "*":
+        return left * right
+    if op == "/":
+        return left // right
+    raise ValueError(f"Unknown operator {op}")
+
+
+def _write_chunks(parts: Iterable[str], stream: BinaryIO) -> None:
+    chunk = []
+    for part in parts:
+        chunk.append(part)
+        if len(chunk) == CHUNK_SIZE:
+            stream.write("".join(chunk).encode())
+            chunk.clear()
+    if chunk:
+        stream.write("".join(chunk).encode())
+
+
+def _varint(n: int) -> bytes:
+    n = n << 1 if n >= 0 else ((-n) << 1) - 1  # zigzag
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+class BinaryEncoder:
+    """
+    Encode solutions as a stream of records, after a `BINARY_MAGIC` header.
+    Every distinct node is written once, children first, and numbered in order of appearance:
+    - leaf: 0, value
+    - node: 1, operator index in OPERATORS, left node number, right node number
+    - solution: 2, root node number
+    All integers are zigzag-encoded varints.
+    """
+
+    def __init__(self) -> None:
+        self._ids: dict[int, int] = {}
+        # holding the nodes keeps their id() from being reused
+        self._keep: list[Any] = []
+
+    def _node(self, node: Any, out: bytearray) -> int:
+        number = self._ids.get(id(node))
+        if number is not None:
+            return number
+        formula = _formula(node)
+        if isinstance(formula, int):
+            out += _varint(_LEAF) + _varint(formula)
+        else:
+            left, op, right = formula
+            left_number = self._node(left, out)
+            right_number = self._node(right, out)
+            out += _varint(_NODE) + _varint(OPERATORS.index(op))
+            out += _varint(left_number) + _varint(right_number)
+        number = self._ids[id(node)] = len(self._ids)
+        self._keep.append(node)
+        return number
+
+    def encode(self, solution: Any) -> bytes:
+        out = bytearray()
+        root = self._node(solution, out)
+        out += _varint(_SOLUTION) + _varint(root)
+        return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (n >> 1) ^ -(n & 1), pos
+
+
+def decode_binary(data: bytes) -> Iterator[Any]:
+    """Decode a binary export, yielding each solution as a v3-style formula (int or tuple)."""
+    if not data.startswith(BINARY_MAGIC):
+        raise ValueError("Not a summle binary export")
+    nodes: list[Any] = []
+    pos = len(BINARY_MAGIC)
+    while pos < len(data):
+        tag, pos = _read_varint(data, pos)
+        if tag == _LEAF:
+            value, pos = _read_varint(data, pos)
+            nodes.append(value)
+        elif tag == _NODE:
+            op, pos = _read_varint(data, pos)
+            left, pos = _read_varint(data, pos)
+            right, pos = _read_varint(data, pos)
+            nodes.append((nodes[left], OPERATORS[op], nodes[right]))
+        elif tag == _SOLUTION:
+            root, pos = _read_varint(data, pos)
+            yield nodes[root]
+        else:
+            raise ValueError(f"Unknown record type {tag}")
+
+
+def export_solutions(solutions: Iterable[Any], format: str, stream: BinaryIO) -> None:
+    """Write all solutions to a binary stream in the given format (one of FORMATS)."""
+    if format == "text":
+        _write_chunks(map(TextRenderer(), solutions), stream)
+    elif format == "jsonl":
+        _write_chunks(map(JsonlRenderer(), solutions), stream)
+    elif format == "binary":
+        encoder = BinaryEncoder()
+        stream.write(BINARY_MAGIC)
+        chunk = bytearray()
+        for solution in solutions:
+            chunk += encoder.encode(solution)
+            if len(chunk) >= CHUNK_SIZE * 16:
+                stream.write(chunk)
+                chunk.clear()
+        stream.write(chunk)
+    else:
+        raise ValueError(
+            f"Unknown format {format}. Valid formats are: {', '.join(FORMATS)}"
+        )
+    stream.flush()
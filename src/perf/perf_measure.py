@@ -1,40 +1,89 @@
+import argparse
 import cProfile
 import gc
+import io
+import json
+import platform
 import pstats
+import shutil
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
 from random import shuffle
 from time import perf_counter
-from typing import Callable, List, Tuple
+from typing import Any, Callable, List, Sequence, Tuple
 
-from algos import v1 as summle_v1
-from algos import v2 as summle_v2
-from algos import v3 as summle_v3
+from export import export_solutions
+from summle import ALGOS, CALIBRATION_FILE, LARGE_NUMBER, best_solution
 
 REFERENCE_INPUT = [2, 3, 6, 7, 10, 75]
 REFERENCE_NUM_SOLUTIONS = 405677
 
+# Peak memory (tracemalloc, bytes) of generate_solutions on the reference input, with ~10% headroom,
+# by CPython (major, minor) version: allocation patterns differ between versions (3.10 peaks ~20% higher).
+# Recorded with CPython 3.10.13, 3.11.7, 3.12.1 and 3.13.0; versions without budgets are not checked.
+# Re-record with `python -m perf.perf_measure --memory` when an engine changes.
+MEMORY_BUDGETS = {
+    (3, 10): {
+        "v1": 175_000_000,
+        "v2": 199_000_000,
+        "v3": 156_000_000,
+        "v4": 133_000_000,
+    },
+    (3, 11): {
+        "v1": 141_000_000,
+        "v2": 174_000_000,
+        "v3": 125_000_000,
+        "v4": 146_000_000,
+    },
+    (3, 12): {
+        "v1": 137_000_000,
+        "v2": 166_000_000,
+        "v3": 122_000_000,
+        "v4": 143_000_000,
+    },
+    (3, 13): {
+        "v1": 141_000_000,
+        "v2": 170_000_000,
+        "v3": 125_000_000,
+        "v4": 136_000_000,
+    },
+}
+COUNTED_TYPES = ("Solution", "tuple", "list", "str")
 
-def v1():
-    solutions = summle_v1.generate_solutions(
-        [summle_v1.Solution(i) for i in REFERENCE_INPUT]
-    )
-    return solutions
+# interpreters looked up on the PATH for the benchmark matrix
+INTERPRETERS = (
+    "python3",
+    "python3.10",
+    "python3.11",
+    "python3.12",
+    "python3.13",
+    "python3.14",
+    "pypy3",
+    "pypy3.10",
+    "pypy3.11",
+)
+SRC_DIR = Path(__file__).parent.parent
 
+CALIBRATION_INPUTS = {
+    "small": REFERENCE_INPUT,
+    "large": [LARGE_NUMBER + i for i in REFERENCE_INPUT],
+}
+CALIBRATION_SIZES = (4, 5, 6)
 
-def v2():
-    solutions = summle_v2.generate_solutions(
-        [summle_v2.Solution(i) for i in REFERENCE_INPUT]
-    )
-    return solutions
 
+def engine_call(version: str, inputs: list[int] = REFERENCE_INPUT) -> Callable:
+    def call():
+        return ALGOS[version](inputs).generate_solutions()
 
-def v3():
-    solutions = summle_v3.generate_solutions(
-        [summle_v3.Solution(i) for i in REFERENCE_INPUT]
-    )
-    return solutions
+    call.__name__ = version
+    return call
 
 
-def measure_call(call: Callable, num_runs: int = 10) -> Tuple[float, float]:
+def measure_call(
+    call: Callable, num_runs: int = 10, verbose: bool = True
+) -> Tuple[float, float]:
     """Measure performance with GC disabled. Returns the average and best results over `num_runs` runs.
 
     Results are deleted after each run to limit the impact of memory consumption.
@@ -50,10 +99,104 @@ def measure_call(call: Callable, num_runs: int = 10) -> Tuple[float, float]:
         assert sum_solutions == REFERENCE_NUM_SOLUTIONS
         gc.enable()
         del solutions
-        print(f"Run {i} took {duration}s")
+        if verbose:
+            print(f"Run {i} took {duration}s")
     return min(results), sum(results) / num_runs
 
 
+def count_objects(root: Any) -> Counter:
+    """Count the objects reachable from `root`, by type name (classes and modules are skipped)."""
+    counts: Counter = Counter()
+    seen = {id(root)}
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        counts[type(obj).__name__] += 1
+        for ref in gc.get_referents(obj):
+            if id(ref) not in seen and not isinstance(ref, type):
+                seen.add(id(ref))
+                stack.append(ref)
+    return counts
+
+
+def measure_memory(call: Callable, count: bool = True) -> dict[str, Any]:
+    """Measure the memory used by a call with tracemalloc, with the GC enabled.
+
+    Returns the peak and retained memory, the number of stored solutions and the bytes per solution,
+    and (if `count` is set) the number of objects of each of COUNTED_TYPES retained by the result.
+    """
+    import tracemalloc  # not available on PyPy
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        solutions = call()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    num_solutions = sum(len(s) for s in solutions.values())
+    result: dict[str, Any] = {
+        "peak": peak,
+        "retained": current,
+        "num_solutions": num_solutions,
+        "bytes_per_solution": current / num_solutions,
+    }
+    if count:
+        counts = count_objects(solutions)
+        result["objects"] = {name: counts[name] for name in COUNTED_TYPES}
+    return result
+
+
+def time_engine(version: str, inputs: list[int]) -> dict[str, float]:
+    """Time solution generation, the best solution for every target (the "steps" query),
+    and rendering a single target the way interactive mode and --all do."""
+    gc.collect()
+    start = perf_counter()
+    solutions = ALGOS[version](inputs).generate_solutions()
+    generate = perf_counter() - start
+
+    start = perf_counter()
+    for values in solutions.values():
+        best_solution(values)
+    steps = perf_counter() - start
+
+    # the target with the most solutions: best solution, then export of all its solutions
+    target = max(solutions, key=lambda value: len(solutions[value]))
+    start = perf_counter()
+    best_solution(solutions[target])
+    export_solutions(solutions[target], "text", io.BytesIO())
+    render = perf_counter() - start
+    return {"generate": generate, "steps": steps, "render": render}
+
+
+def calibrate(num_rounds: int = 3) -> dict[str, dict]:
+    """Record the best timings of every engine for each input size and magnitude, for `summle -v auto`."""
+    data: dict[str, dict] = {}
+    for size in CALIBRATION_SIZES:
+        data[str(size)] = {}
+        for magnitude, inputs in CALIBRATION_INPUTS.items():
+            timings = data[str(size)][magnitude] = {}
+            for version in ALGOS:
+                runs = [time_engine(version, inputs[:size]) for _ in range(num_rounds)]
+                timings[version] = {
+                    k: round(min(r[k] for r in runs), 6) for k in runs[0]
+                }
+                print(f"{size} {magnitude} {version}: {timings[version]}")
+    return data
+
+
+def save_calibration(data: dict[str, dict]) -> None:
+    try:
+        with open(CALIBRATION_FILE) as f:
+            calibration = json.load(f)
+    except OSError:
+        calibration = {}
+    calibration[platform.python_implementation()] = data
+    with open(CALIBRATION_FILE, "w") as f:
+        json.dump(calibration, f, indent=2)
+        f.write("\n")
+
+
 def profile_call(call: Callable):
     with cProfile.Profile() as pr:
         call()
@@ -70,6 +213,135 @@ def time(callables: List[Callable], num_rounds: int = 10) -> None:
         print(measure_call(c, num_rounds))
 
 
+def find_interpreters(extra: Sequence[str] = ()) -> dict[str, str]:
+    """Return the Python 3.10+ interpreters found on the PATH (and in `extra`),
+    as {"<implementation> <version>": path}."""
+    found: dict[str, str] = {}
+    for name in [*extra, *INTERPRETERS]:
+        path = shutil.which(name)
+        if path is None:
+            continue
+        try:
+            output = subprocess.run(
+                [
+                    path,
+                    "-c",
+                    "import platform, sys; "
+                    "print(platform.python_implementation(), platform.python_version(), "
+                    "sys.version_info >= (3, 10))",
+                ],
+                capture_output=True,
+                text=True,
+                timeout=30,
+            ).stdout.split()
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if len(output) == 3 and output[2] == "True":
+            found.setdefault(f"{output[0]} {output[1]}", path)
+    return found
+
+
+def matrix(
+    num_rounds: int = 10, extra: Sequence[str] = ()
+) -> dict[str, dict[str, list[float]]]:
+    """Time every engine with every local interpreter. Returns {interpreter: {engine: [best, average]}}."""
+    results = {}
+    for label, path in find_interpreters(extra).items():
+        print(f"**** {label} ({path}) ****")
+        process = subprocess.run(
+            [path, "-m", "perf.perf_measure", "--json", "-n", str(num_rounds)],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines()
+            error = lines[-1] if lines else f"exit status {process.returncode}"
+            print(f"failed: {error}")
+            continue
+        results[label] = json.loads(process.stdout)
+        print(results[label])
+    return results
+
+
+def print_matrix(results: dict[str, dict[str, list[float]]]) -> None:
+    """Print best (average) times as a markdown table, one column per interpreter."""
+    labels = list(results)
+    print(f"| engine | {' | '.join(labels)} |")
+    print(f"| ------ |{' --- |' * len(labels)}")
+    for version in ALGOS:
+        cells = [
+            "{:.2f}s ({:.2f}s)".format(*results[label][version])
+            if version in results[label]
+            else "-"
+            for label in labels
+        ]
+        print(f"| {version} | {' | '.join(cells)} |")
+
+
+def memory(callables: List[Callable]) -> None:
+    for c in callables:
+        print(f"**** {c.__name__} ****")
+        result = measure_memory(c)
+        print(
+            f"peak: {result['peak'] / 1e6:.1f} MB, retained: {result['retained'] / 1e6:.1f} MB"
+        )
+        print(
+            f"{result['num_solutions']} solutions, {result['bytes_per_solution']:.0f} bytes per solution"
+        )
+        print(", ".join(f"{name}: {n}" for name, n in result["objects"].items()))
+
+
 if __name__ == "__main__":
-    time([v1, v2, v3])
-    # profile_call(v3)
+    parser = argparse.ArgumentParser(
+        description="Measure the summle engines on the reference input."
+    )
+    parser.add_argument(
+        "--memory", action="store_true", help="measure memory instead of time"
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="record engine timings for this interpreter in the calibration file used by `-v auto`",
+    )
+    parser.add_argument(
+        "--matrix",
+        action="store_true",
+        help="time every engine with every Python 3.10+ interpreter found on the PATH",
+    )
+    parser.add_argument(
+        "--interpreter",
+        action="append",
+        default=[],
+        help="additional interpreter to include in --matrix (can be repeated)",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the best and average time of each engine as JSON (used by --matrix)",
+    )
+    parser.add_argument(
+        "--profile", choices=ALGOS.keys(), help="profile a single engine"
+    )
+    parser.add_argument(
+        "-n", "--num-rounds", type=int, help="default: 10, or 3 with --calibrate"
+    )
+    args = parser.parse_args()
+
+    callables = [engine_call(version) for version in ALGOS]
+    if args.calibrate:
+        save_calibration(calibrate(args.num_rounds or 3))
+    elif args.profile:
+        profile_call(engine_call(args.profile))
+    elif args.memory:
+        memory(callables)
+    elif args.matrix:
+        print_matrix(matrix(args.num_rounds or 10, args.interpreter))
+    elif args.json:
+        timings = {
+            c.__name__: measure_call(c, args.num_rounds or 10, verbose=False)
+            for c in callables
+        }
+        json.dump(timings, sys.stdout)
+    else:
+        time(callables, args.num_rounds or 10)
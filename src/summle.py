@@ -1,21 +1,170 @@
 import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
 import re
-from typing import Iterable
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, Mapping
+from urllib.error import HTTPError
 from urllib.request import urlopen
+from zoneinfo import ZoneInfo
 
-from algos.base import BaseSolution
+from algos.base import BaseSolution, BaseSolver
 from algos.v1 import Solver as V1Solver
 from algos.v2 import Solver as V2Solver
 from algos.v3 import Solver as V3Solver
+from algos.v4 import Solver as V4Solver
+from export import FORMATS, export_solutions
 
-ALGOS = {"v1": V1Solver, "v2": V2Solver, "v3": V3Solver}
+ALGOS = {"v1": V1Solver, "v2": V2Solver, "v3": V3Solver, "v4": V4Solver}
 DIFFICULTIES = {"medium": "", "hard": "/hard", "extreme": "/extreme"}
+SUMMLE_URL = "https://summle.net"
+CACHE_DIR = Path(os.environ.get("SUMMLE_CACHE_DIR", "~/.cache/summle")).expanduser()
+# Cached answers are keyed by the puzzle day, i.e. the date in the time zone where summle.net
+# rolls over to a new puzzle. Midnight UTC is assumed; set SUMMLE_TZ if the site differs.
+SITE_TIMEZONE = os.environ.get("SUMMLE_TZ", "UTC")
+# timings of each engine, recorded by `python -m perf.perf_measure --calibrate`
+CALIBRATION_FILE = Path(__file__).parent / "perf" / "calibration.json"
+DEFAULT_ENGINE = "v2"
+LARGE_NUMBER = 1000  # inputs at least this large use the "large" calibration timings
 
 
 def best_solution(solutions: Iterable[BaseSolution]) -> BaseSolution:
     return sorted(solutions, key=(lambda s: s.num_steps))[0]
 
 
+@dataclass
+class Answer:
+    target: int
+    # best solution for the target or, if it wasn't reached, for the closest value found
+    solution: BaseSolution | None
+    num_solutions: int  # number of solutions found for the target
+    optimal: bool  # no better solution (or closer value) exists
+    exhausted: bool  # the search was not stopped by its deadline
+
+
+def make_answer(
+    solver: BaseSolver, solutions: Mapping[int, set[BaseSolution]], target: int
+) -> Answer:
+    """Pick the best solution for the target (or the closest value) from a possibly partial search."""
+    if target in solutions:
+        solution = best_solution(solutions[target])
+        optimal = solver.exhausted or solution.num_steps <= solver.searched_steps
+        return Answer(
+            target, solution, len(solutions[target]), optimal, solver.exhausted
+        )
+    if not solutions:
+        return Answer(target, None, 0, solver.exhausted, solver.exhausted)
+    closest = min(solutions, key=lambda value: abs(value - target))
+    solution = best_solution(solutions[closest])
+    return Answer(target, solution, 0, solver.exhausted, solver.exhausted)
+
+
+def solve(
+    numbers: list[int],
+    target: int,
+    version: str = "auto",
+    timeout: float | None = None,
+) -> Answer:
+    """
+    Solve a puzzle within an optional time budget (in seconds).
+    When the budget runs out, return the best solution found so far, or the closest value.
+    """
+    start = time.perf_counter()
+    if version == "auto":
+        version, _ = choose_engine(numbers)
+    solver = ALGOS[version](numbers)
+    deadline = None if timeout is None else start + timeout
+    solutions = solver.generate_solutions(deadline)
+    return make_answer(solver, solutions, target)
+
+
+def load_calibration(path: Path = CALIBRATION_FILE) -> dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def choose_engine(
+    numbers: list[int],
+    single_target: bool = True,
+    all_solutions: bool = False,
+    implementation: str | None = None,
+    calibration: dict[str, Any] | None = None,
+) -> tuple[str, str]:
+    """
+    Pick the engine expected to be the fastest for a query, from calibration timings.
+    Returns the engine name and the reason for picking it.
+
+    Calibration data maps interpreter -> number of inputs -> magnitude ("small" or "large")
+    -> engine -> timings in seconds:
+    - "generate": time to generate all solutions
+    - "steps": time to compute the number of steps of every solution (best solution for every target)
+    - "render": time to find the best solution for a single target and export all its solutions
+      (interactive mode and --all)
+    Missing timings fall back to the other magnitude, then to DEFAULT_ENGINE.
+    """
+    implementation = implementation or platform.python_implementation()
+    if calibration is None:
+        calibration = load_calibration()
+    if not calibration:
+        return DEFAULT_ENGINE, "no calibration data, using the default engine"
+    source = (
+        implementation if implementation in calibration else next(iter(calibration))
+    )
+    notes = (
+        []
+        if source == implementation
+        else [f"no calibration data for {implementation}"]
+    )
+
+    if all_solutions:
+        query, extra = "all solutions", "render"
+    elif single_target:
+        query, extra = "single target", None
+    else:
+        query, extra = "best solution for every target", "steps"
+    needed = ("generate", extra) if extra else ("generate",)
+
+    by_size = calibration[source]
+    size = min(by_size, key=lambda n: abs(int(n) - len(numbers)), default=None)
+    by_magnitude = by_size[size] if size is not None else {}
+    magnitude = "large" if max(numbers, default=0) >= LARGE_NUMBER else "small"
+    if magnitude not in by_magnitude and by_magnitude:
+        other = next(iter(by_magnitude))
+        notes.append(f"no timings for {magnitude} inputs, using {other} ones")
+        magnitude = other
+    timings = {
+        e: t
+        for e, t in by_magnitude.get(magnitude, {}).items()
+        if e in ALGOS and all(k in t for k in needed)
+    }
+    if not timings:
+        reason = f"no usable calibration data for {query} on {source}, using the default engine"
+        return DEFAULT_ENGINE, reason
+
+    def cost(engine: str) -> float:
+        return sum(timings[engine][k] for k in needed)
+
+    engine = min(timings, key=cost)
+    reason = (
+        f"fastest for {query} with {len(numbers)} {magnitude} inputs on {source} "
+        f"({', '.join(f'{e}: {cost(e):.3f}s' for e in sorted(timings))})"
+    )
+    if size != str(len(numbers)):
+        notes.append(f"using timings for {size} inputs")
+    return engine, ", ".join([reason, *notes])
+
+
 def prime_factors(n: int) -> list[int]:
     """Return the prime factors of the given integer as a list of integers."""
     i = 2
@@ -114,10 +263,8 @@ def run_interactive(solutions: list[BaseSolution], target: int, inputs: list[int
         if user_input.lower() in ("q", "quit", "exit"):
             break
         elif user_input.lower() in ("all",):
-            for sol in solutions:
-                for line in sol.explain(header=True):
-                    print(line)
-                print("-" * 20)
+            sys.stdout.flush()
+            export_solutions(solutions, "text", sys.stdout.buffer)
         elif user_input.lower() in ("h", "hint"):
             if hints:
                 print(hints.pop(0))
@@ -136,27 +283,210 @@ def run_interactive(solutions: list[BaseSolution], target: int, inputs: list[int
                     break
 
 
-def fetch_daily_problem(difficulty: str) -> tuple[int, list[int]]:
-    """Fetch the daily problem for the given difficulty level from summle.net."""
+class HttpSource:
+    """Fetch daily puzzle pages over HTTP, with a timeout and a few retries on network and server errors."""
+
+    def __init__(
+        self, base_url: str = SUMMLE_URL, timeout: float = 10, retries: int = 2
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+
+    def __call__(self, difficulty: str) -> str:
+        url = self.base_url + DIFFICULTIES[difficulty]
+        for attempt in range(self.retries):
+            try:
+                return self._get(url)
+            except HTTPError as error:
+                if error.code < 500:
+                    raise  # the page won't appear by asking again (404, 403...)
+            except OSError:  # connection errors and timeouts
+                pass
+            time.sleep(0.5 * 2**attempt)
+        return self._get(url)
+
+    def _get(self, url: str) -> str:
+        with urlopen(url, timeout=self.timeout) as response:
+            return response.read().decode("utf-8")
+
+
+class FileSource:
+    """Read saved daily puzzle pages from `<directory>/<difficulty>.html`."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
 
-    url = "https://summle.net" + DIFFICULTIES[difficulty]
+    def __call__(self, difficulty: str) -> str:
+        return (self.directory / f"{difficulty}.html").read_text(encoding="utf-8")
+
+
+PageSource = Callable[[str], str]
+
+
+def make_source(location: str | None) -> PageSource:
+    """Build a page source from a base URL or a directory of saved pages."""
+    if location is None:
+        return HttpSource()
+    if location.startswith(("http://", "https://")):
+        return HttpSource(location)
+    return FileSource(location)
+
+
+def parse_daily_problem(html: str) -> tuple[int, list[int]]:
+    """Extract the target and input numbers from a summle.net page."""
     # window.puzzString contains the numbers and target as a comma-separated string
     puzzle_pattern = r'window\.puzzString\s*=\s*"([^"]+)";'
+    puzzle_match = re.search(puzzle_pattern, html)
+    if not puzzle_match:
+        raise ValueError("Could not find daily problem.")
+    puzzle_numbers = list(map(int, puzzle_match.group(1).split(",")))
+    return puzzle_numbers[-1], puzzle_numbers[:-1]
 
-    with urlopen(url) as response:
-        html = response.read().decode("utf-8")
 
-    puzzle_match = re.search(puzzle_pattern, html)
+def fetch_daily_problem(
+    difficulty: str, source: PageSource | None = None
+) -> tuple[int, list[int]]:
+    """Fetch the daily problem for the given difficulty level (from summle.net by default)."""
+    if source is None:
+        source = HttpSource()
+    target, numbers = parse_daily_problem(source(difficulty))
+    print(
+        f"Fetched {difficulty} daily problem: target={target}, numbers={numbers}",
+        file=sys.stderr,
+    )
+    return target, numbers
+
 
-    if puzzle_match:
-        puzzle_string = puzzle_match.group(1)
-        puzzle_numbers = list(map(int, puzzle_string.split(",")))
-        target = puzzle_numbers[-1]
-        numbers = puzzle_numbers[:-1]
-        print(f"Fetched {difficulty} daily problem: target={target}, numbers={numbers}")
-        return target, numbers
+def solve_puzzle(version: str, target: int, numbers: list[int]) -> dict[str, Any]:
+    """Solve a puzzle and return a JSON-serializable answer (best solution only)."""
+    if version == "auto":
+        version, _ = choose_engine(numbers)
+    solutions = ALGOS[version](numbers).generate_solutions()
+    answer: dict[str, Any] = {
+        "target": target,
+        "numbers": numbers,
+        "num_solutions": 0,
+        "explanation": [],
+    }
+    if target in solutions:
+        answer["num_solutions"] = len(solutions[target])
+        answer["explanation"] = best_solution(solutions[target]).explain(header=True)
+    return answer
 
-    raise ValueError("Could not find daily problem.")
+
+def puzzle_day() -> date:
+    """Return the day of the current summle.net puzzle (the date in SITE_TIMEZONE)."""
+    return datetime.now(ZoneInfo(SITE_TIMEZONE)).date()
+
+
+def cache_path(day: date | None = None, cache_dir: Path | None = None) -> Path:
+    day = day or puzzle_day()
+    return (cache_dir or CACHE_DIR) / f"daily-{day.isoformat()}.json"
+
+
+def load_cached_answer(
+    difficulty: str, day: date | None = None, cache_dir: Path | None = None
+) -> dict[str, Any] | None:
+    """Return the cached answer for today's puzzle, or None if it hasn't been prefetched."""
+    try:
+        with open(cache_path(day, cache_dir)) as f:
+            return json.load(f).get(difficulty)
+    except (OSError, ValueError):
+        return None
+
+
+def store_answers(
+    answers: dict[str, dict[str, Any]],
+    day: date | None = None,
+    cache_dir: Path | None = None,
+) -> Path:
+    path = cache_path(day, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    cached.update(answers)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(cached, f)
+    tmp.replace(path)
+    return path
+
+
+async def prefetch_answers(
+    version: str = "auto",
+    source: PageSource | None = None,
+    difficulties: Iterable[str] = DIFFICULTIES,
+) -> dict[str, dict[str, Any] | BaseException]:
+    """
+    Fetch all daily puzzles concurrently, then solve them in parallel processes.
+    A difficulty that can't be fetched or solved maps to the exception raised.
+    """
+    source = source or HttpSource()
+    difficulties = list(difficulties)
+    loop = asyncio.get_running_loop()
+    # workers are spawned, not forked: the fetch threads may hold locks (urllib, SSL) at fork time
+    with ProcessPoolExecutor(
+        max_workers=len(difficulties), mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+
+        async def fetch_and_solve(difficulty: str) -> dict[str, Any]:
+            target, numbers = await asyncio.to_thread(
+                fetch_daily_problem, difficulty, source
+            )
+            return await loop.run_in_executor(
+                pool, solve_puzzle, version, target, numbers
+            )
+
+        answers = await asyncio.gather(
+            *(fetch_and_solve(d) for d in difficulties), return_exceptions=True
+        )
+    return dict(zip(difficulties, answers))
+
+
+def prefetch(
+    version: str = "auto",
+    source: PageSource | None = None,
+    cache_dir: Path | None = None,
+    source_name: str | None = None,
+) -> tuple[Path | None, dict[str, BaseException]]:
+    """
+    Prefetch and solve all of today's puzzles, and store the answers in the local cache,
+    tagged with `source_name` (the --source option, None for summle.net).
+    Returns the cache file (None if nothing was stored) and the failures, by difficulty.
+    """
+    results = asyncio.run(prefetch_answers(version, source))
+    answers = {
+        d: {**r, "source": source_name}
+        for d, r in results.items()
+        if not isinstance(r, BaseException)
+    }
+    failures = {d: r for d, r in results.items() if isinstance(r, BaseException)}
+    path = store_answers(answers, cache_dir=cache_dir) if answers else None
+    return path, failures
+
+
+def print_answer(answer: dict[str, Any]) -> None:
+    if not answer["num_solutions"]:
+        print(f"Could not find a solution for {answer['target']}")
+        return
+    print(f"There are {answer['num_solutions']} solutions for {answer['target']}.")
+    for line in answer["explanation"]:
+        print(line)
+
+
+def print_stats(
+    version: str, reason: str, duration: float, solutions: Mapping[int, Any]
+) -> None:
+    print(f"engine: {version} ({reason})", file=sys.stderr)
+    print(f"solving time: {duration:.3f}s", file=sys.stderr)
+    print(
+        f"solutions: {sum(len(s) for s in solutions.values())} for {len(solutions)} values",
+        file=sys.stderr,
+    )
 
 
 def main():
@@ -168,25 +498,54 @@ def main():
             "  summle -v v3 -i 562 2 3 7 8 10\n"
             "  summle hard\n"
             "  summle -i medium\n"
+            "  summle prefetch\n"
+            "  summle --all --format jsonl 831 100 3 7 9 25 50\n"
         ),
     )
     # Add common arguments
     parser.add_argument(
         "-v",
         "--version",
-        default="v2",
-        choices=["v1", "v2", "v3"],
-        help="the algorithm version to use (default: v2)",
+        default="auto",
+        choices=["auto", *ALGOS],
+        help="the algorithm version to use (default: auto, picked from calibration data)",
     )
     parser.add_argument(
         "-i", "--interactive", action="store_true", help="run in interactive mode"
     )
+    parser.add_argument(
+        "--source",
+        help="base URL or directory of saved pages to fetch daily puzzles from (default: summle.net)",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="output all solutions instead of the best one",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        help="output format for --all (default: text)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="stop searching after this time and show the best answer found so far",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the engine used, why it was picked and the solving time (on stderr)",
+    )
 
     # Figure out if we have target + integers or difficulty
     known_args, rest = parser.parse_known_args()
+    if known_args.format is not None and not known_args.all:
+        parser.error("--format requires --all")
 
     if not rest:
-        parser.error("Provide either: TARGET INTEGERS...  or  DIFFICULTY")
+        parser.error("Provide either: TARGET INTEGERS...  or  DIFFICULTY  or  prefetch")
 
     first = rest[0]
     if first.isdigit():
@@ -197,27 +556,90 @@ def main():
         args = direct.parse_args(rest)
         target = args.target
         numbers = args.integers
+    elif first.lower() == "prefetch":
+        path, failures = prefetch(
+            known_args.version,
+            make_source(known_args.source),
+            source_name=known_args.source,
+        )
+        if path is not None:
+            print(f"Stored daily answers in {path}")
+        for difficulty, error in failures.items():
+            print(
+                f"Could not prefetch {difficulty}: {type(error).__name__}: {error}",
+                file=sys.stderr,
+            )
+        if failures:
+            sys.exit(1)
+        return
     elif (difficulty := first.lower()) in DIFFICULTIES.keys():
-        target, numbers = fetch_daily_problem(difficulty)
+        cached = load_cached_answer(difficulty)
+        if cached is not None and cached.get("source") != known_args.source:
+            cached = None  # prefetched from another source
+        if cached is None:
+            target, numbers = fetch_daily_problem(
+                difficulty, make_source(known_args.source)
+            )
+        elif not (
+            known_args.interactive
+            or known_args.all
+            or known_args.stats
+            or known_args.version != "auto"
+        ):
+            print_answer(cached)
+            return
+        else:
+            # reuse the cached puzzle, but solve it as requested
+            target, numbers = cached["target"], cached["numbers"]
     else:
         parser.error(
             f"Unrecognized difficulty level: {first}. Valid levels are: {', '.join(DIFFICULTIES.keys())}"
         )
 
-    algo = ALGOS[known_args.version]
-    solutions = algo(numbers).generate_solutions()
+    if known_args.version == "auto":
+        version, reason = choose_engine(
+            numbers, all_solutions=known_args.all or known_args.interactive
+        )
+    else:
+        version, reason = known_args.version, "requested with --version"
+    start = time.perf_counter()
+    solver = ALGOS[version](numbers)
+    deadline = None if known_args.timeout is None else start + known_args.timeout
+    solutions = solver.generate_solutions(deadline)
+    if known_args.stats:
+        print_stats(version, reason, time.perf_counter() - start, solutions)
+    if not solver.exhausted:
+        print(
+            f"Stopped after {known_args.timeout}s, "
+            f"searched all solutions with up to {solver.searched_steps} steps.",
+            file=sys.stderr,
+        )
     if target not in solutions:
-        print(f"Could not find a solution for {target}")
+        print(
+            f"Could not find a solution for {target}",
+            file=sys.stderr if known_args.all else sys.stdout,
+        )
+        answer = make_answer(solver, solutions, target)
+        if answer.solution is not None and not known_args.all:
+            print(f"Closest value found: {answer.solution.value}")
+            for line in answer.solution.explain(header=True):
+                print(line)
     else:
         solutions_for_target = solutions[target]
         solution = best_solution(solutions_for_target)
-        if known_args.interactive:
+        if known_args.all:
+            export_solutions(
+                solutions_for_target, known_args.format or "text", sys.stdout.buffer
+            )
+        elif known_args.interactive:
             run_interactive(solutions_for_target, target, numbers)
         else:
             print(f"There are {len(solutions_for_target)} solutions for {target}.")
             explain_best = solution.explain(header=True)
             for line in explain_best:
                 print(line)
+            if not make_answer(solver, solutions, target).optimal:
+                print("This solution is not proven optimal.")
 
 
 if __name__ == "__main__":
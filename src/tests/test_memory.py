@@ -0,0 +1,40 @@
+import platform
+import sys
+
+import pytest
+
+from perf.perf_measure import (
+    MEMORY_BUDGETS,
+    REFERENCE_NUM_SOLUTIONS,
+    engine_call,
+    measure_memory,
+)
+from summle import ALGOS
+
+BUDGETS = MEMORY_BUDGETS.get(sys.version_info[:2], {})
+
+pytestmark = [
+    pytest.mark.slow,
+    pytest.mark.skipif(
+        platform.python_implementation() != "CPython",
+        reason="budgets are recorded with CPython's tracemalloc",
+    ),
+]
+
+
+@pytest.mark.parametrize("python", MEMORY_BUDGETS)
+def test_every_engine_has_a_budget(python):
+    assert MEMORY_BUDGETS[python].keys() == ALGOS.keys()
+
+
+@pytest.mark.skipif(
+    not BUDGETS,
+    reason=f"no memory budgets recorded for Python {platform.python_version()}",
+)
+@pytest.mark.parametrize("version", ALGOS)
+def test_peak_memory_within_budget(version):
+    result = measure_memory(engine_call(version), count=False)
+    assert result["num_solutions"] == REFERENCE_NUM_SOLUTIONS
+    assert result["peak"] <= BUDGETS[version], (
+        f"{version} peaked at {result['peak']} bytes (budget {BUDGETS[version]})"
+    )
@@ -1,9 +1,20 @@
+import io
+import json
+import sys
+import time
+from itertools import combinations
+from urllib.error import HTTPError
+
 import pytest
 
+import export
 import summle
+from algos import base
 from algos.v1 import Solver as V1
 from algos.v2 import Solver as V2
 from algos.v3 import Solver as V3
+from algos.v4 import Solver as V4
+from perf.perf_measure import REFERENCE_INPUT
 
 
 @pytest.fixture(scope="session")
@@ -28,8 +39,15 @@ def v3_solutions():
 
 
 @pytest.fixture(scope="session")
-def all_solutions(base_solutions, v2_solutions, v3_solutions):
-    return [base_solutions, v2_solutions, v3_solutions]
+def v4_solutions():
+    solver = V4([1, 2, 3, 4])
+    solutions = solver.generate_solutions()
+    return solutions
+
+
+@pytest.fixture(scope="session")
+def all_solutions(base_solutions, v2_solutions, v3_solutions, v4_solutions):
+    return [base_solutions, v2_solutions, v3_solutions, v4_solutions]
 
 
 def test_solutions_are_complete(all_solutions):
@@ -58,3 +76,342 @@ def test_best_solution(base_solutions):
 def test_solutions_for_11(base_solutions):
     assert len(base_solutions[11]) == 9
     assert summle.best_solution(base_solutions[11]).num_steps == 2
+
+
+PUZZLES = {"medium": "1,2,3,4,28", "hard": "1,2,3,4,36", "extreme": "1,2,3,4,29"}
+
+
+def puzzle_page(puzzle: str) -> str:
+    return f'<html><script>window.puzzString = "{puzzle}";</script></html>'
+
+
+@pytest.fixture
+def saved_pages(tmp_path):
+    for difficulty, puzzle in PUZZLES.items():
+        (tmp_path / f"{difficulty}.html").write_text(puzzle_page(puzzle))
+    return tmp_path
+
+
+@pytest.fixture
+def fixture_server():
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    paths = {path: PUZZLES[d] for d, path in summle.DIFFICULTIES.items()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = puzzle_page(paths[self.path.rstrip("/")]).encode()
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_fetch_daily_problem_from_server(fixture_server):
+    source = summle.make_source(fixture_server)
+    assert summle.fetch_daily_problem("hard", source) == (36, [1, 2, 3, 4])
+
+
+@pytest.fixture
+def failing_server():
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    statuses = {"/hard": 404, "/extreme": 503}
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            self.send_response(statuses[self.path])
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", requests
+    server.shutdown()
+
+
+def test_http_source_only_retries_server_errors(failing_server, monkeypatch):
+    url, requests = failing_server
+    monkeypatch.setattr(summle.time, "sleep", lambda seconds: None)
+    source = summle.HttpSource(url, retries=2)
+    with pytest.raises(HTTPError, match="404"):
+        source("hard")
+    assert requests == ["/hard"]
+    with pytest.raises(HTTPError, match="503"):
+        source("extreme")
+    assert requests == ["/hard"] + ["/extreme"] * 3
+
+
+def test_prefetch_stores_answers(saved_pages, tmp_path):
+    summle.prefetch(source=summle.FileSource(saved_pages), cache_dir=tmp_path)
+    medium = summle.load_cached_answer("medium", cache_dir=tmp_path)
+    assert medium["target"] == 28
+    assert medium["explanation"][0] == "28 can be computed in 3 steps:"
+    assert summle.load_cached_answer("hard", cache_dir=tmp_path)["num_solutions"] == 3
+    assert (
+        summle.load_cached_answer("extreme", cache_dir=tmp_path)["num_solutions"] == 0
+    )
+
+
+def run_main(monkeypatch, capsys, *args):
+    monkeypatch.setattr(sys, "argv", ["summle", *args])
+    summle.main()
+    return capsys.readouterr()
+
+
+def test_cached_answer_only_served_for_its_source(
+    saved_pages, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.setattr(summle, "CACHE_DIR", tmp_path)
+    summle.prefetch(source=summle.FileSource(saved_pages), source_name=str(saved_pages))
+    capsys.readouterr()
+    source = ["--source", str(saved_pages)]
+
+    out = run_main(monkeypatch, capsys, *source, "hard")
+    assert "There are 3 solutions for 36." in out.out
+    assert "Fetched" not in out.err and "engine:" not in out.err
+
+    # an explicit engine or --stats solve the cached puzzle again
+    out = run_main(monkeypatch, capsys, *source, "--stats", "-v", "v1", "hard")
+    assert "There are 3 solutions for 36." in out.out
+    assert "engine: v1" in out.err and "Fetched" not in out.err
+
+    # a different source (or summle.net) doesn't use the cache
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "hard.html").write_text(puzzle_page("1,2,3,4,27"))
+    out = run_main(monkeypatch, capsys, "--source", str(other), "hard")
+    assert "Fetched hard daily problem" in out.err
+    assert "solutions for 27." in out.out
+
+
+def test_prefetch_stores_answers_despite_failures(saved_pages, tmp_path):
+    (saved_pages / "extreme.html").unlink()
+    path, failures = summle.prefetch(
+        source=summle.FileSource(saved_pages), cache_dir=tmp_path
+    )
+    assert path is not None
+    assert list(failures) == ["extreme"]
+    assert isinstance(failures["extreme"], FileNotFoundError)
+    assert summle.load_cached_answer("medium", cache_dir=tmp_path)["target"] == 28
+    assert summle.load_cached_answer("extreme", cache_dir=tmp_path) is None
+
+
+def test_export_text_matches_explain(all_solutions):
+    for solutions in all_solutions:
+        stream = io.BytesIO()
+        export.export_solutions(solutions[11], "text", stream)
+        expected = "".join(
+            "\n".join(s.explain(header=True)) + "\n" + "-" * 20 + "\n"
+            for s in solutions[11]
+        )
+        assert stream.getvalue().decode() == expected
+
+
+def test_format_requires_all(monkeypatch, capsys):
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, capsys, "--format", "jsonl", "36", "1", "2", "3", "4")
+    assert "--format requires --all" in capsys.readouterr().err
+
+    out = run_main(
+        monkeypatch, capsys, "--all", "--format", "jsonl", "36", "1", "2", "3", "4"
+    )
+    assert [json.loads(line)["value"] for line in out.out.splitlines()] == [36] * 3
+
+
+def formula_str(formula):
+    if isinstance(formula, int):
+        return str(formula)
+    left, op, right = formula
+    return f"({formula_str(left)}{op}{formula_str(right)})"
+
+
+def test_export_formats_agree(all_solutions):
+    for solutions in all_solutions:
+        stream = io.BytesIO()
+        export.export_solutions(solutions[36], "jsonl", stream)
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert len(records) == len(solutions[36])
+        assert {r["value"] for r in records} == {36}
+
+        stream = io.BytesIO()
+        export.export_solutions(solutions[36], "binary", stream)
+        decoded = export.decode_binary(stream.getvalue())
+        assert sorted(map(formula_str, decoded)) == sorted(
+            r["formula"] for r in records
+        )
+
+
+CALIBRATION = {
+    "CPython": {
+        "4": {
+            "small": {
+                "v1": {"generate": 0.3, "steps": 0.0, "render": 0.1},
+                "v2": {"generate": 0.2, "steps": 0.0, "render": 0.1},
+                "v3": {"generate": 0.1, "steps": 0.2, "render": 0.5},
+            },
+            "large": {
+                "v1": {"generate": 0.1, "steps": 0.0, "render": 0.1},
+                "v2": {"generate": 0.2, "steps": 0.0, "render": 0.1},
+                "v3": {"generate": 0.3, "steps": 0.2, "render": 0.5},
+            },
+        }
+    },
+    "PyPy": {
+        "4": {
+            "small": {
+                "v1": {"generate": 0.01, "steps": 0.0, "render": 0.01},
+                "v2": {"generate": 0.02, "steps": 0.0, "render": 0.01},
+                "v3": {"generate": 0.03, "steps": 0.0, "render": 0.01},
+            },
+        }
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "numbers, kwargs, expected",
+    [
+        ([1, 2, 3, 4], {}, "v3"),
+        ([1, 2, 3, 4], {"all_solutions": True}, "v2"),
+        ([1, 2, 3, 4], {"single_target": False}, "v2"),
+        ([1, 2, 3, 4000], {}, "v1"),
+        ([1, 2, 3, 4, 5, 6], {"implementation": "PyPy"}, "v1"),
+        ([1, 2, 3, 4], {"implementation": "GraalVM"}, "v3"),
+    ],
+)
+def test_choose_engine(numbers, kwargs, expected):
+    engine, reason = summle.choose_engine(numbers, calibration=CALIBRATION, **kwargs)
+    assert engine == expected
+    assert reason
+
+
+@pytest.mark.parametrize(
+    "calibration",
+    [
+        {},
+        {"CPython": {}},
+        {"CPython": {"4": {}}},
+        {"CPython": {"4": {"small": {"v0": {"generate": 0.1}}}}},
+        {"CPython": {"4": {"small": {"v1": {"steps": 0.1}}}}},
+    ],
+)
+def test_choose_engine_with_unusable_calibration(calibration):
+    engine, reason = summle.choose_engine(
+        [1, 2, 3, 4], implementation="CPython", calibration=calibration
+    )
+    assert engine == summle.DEFAULT_ENGINE
+    assert "default engine" in reason
+
+
+def test_choose_engine_reports_nearest_calibrated_size():
+    _, reason = summle.choose_engine(
+        [1, 2, 3, 4, 5, 6, 7], implementation="CPython", calibration=CALIBRATION
+    )
+    assert "with 7 small inputs" in reason
+    assert reason.endswith("using timings for 4 inputs")
+
+    _, reason = summle.choose_engine(
+        [1, 2, 3, 4], implementation="CPython", calibration=CALIBRATION
+    )
+    assert "with 4 small inputs" in reason and "using timings" not in reason
+
+
+def test_choose_engine_falls_back_to_other_magnitude():
+    engine, reason = summle.choose_engine(
+        [1, 2, 3, 4000], implementation="PyPy", calibration=CALIBRATION
+    )
+    assert engine == "v1"
+    assert "using small ones" in reason
+
+
+def test_choose_engine_without_calibration():
+    assert (
+        summle.choose_engine([1, 2, 3, 4], calibration={})[0] == summle.DEFAULT_ENGINE
+    )
+
+
+def count_expanded_pairs(monkeypatch, solver, inputs, prune):
+    module = sys.modules[solver.__module__]
+    expanded = 0
+
+    def pairs(state, key):
+        nonlocal expanded
+        result = list(
+            base.distinct_pairs(state, key)
+            if prune
+            else combinations(range(len(state)), 2)
+        )
+        expanded += len(result)
+        return result
+
+    with monkeypatch.context() as m:
+        m.setattr(module, "distinct_pairs", pairs)
+        solutions = solver(inputs).generate_solutions()
+    return solutions, expanded
+
+
+@pytest.mark.parametrize("solver", [V1, V2, V3])
+@pytest.mark.parametrize("inputs", [[2, 2, 3, 3, 25], [5, 5, 5, 7, 100]])
+def test_duplicate_inputs_are_pruned(monkeypatch, solver, inputs):
+    pruned, pruned_pairs = count_expanded_pairs(monkeypatch, solver, inputs, True)
+    full, full_pairs = count_expanded_pairs(monkeypatch, solver, inputs, False)
+    assert pruned == full
+    assert pruned_pairs * 2 < full_pairs
+
+
+def test_solve_without_timeout_is_optimal():
+    answer = summle.solve([1, 2, 3, 4], 11, version="v1")
+    assert answer.exhausted and answer.optimal
+    assert answer.num_solutions == 9
+    assert answer.solution is not None and answer.solution.num_steps == 2
+
+
+@pytest.mark.parametrize("inputs", [[2, 2, 3, 3, 25], [5, 5, 5, 7, 100]])
+def test_v4_matches_v1(inputs):
+    def formulas(solutions):
+        return {value: {str(s) for s in group} for value, group in solutions.items()}
+
+    v1 = formulas(V1(inputs).generate_solutions())
+    assert formulas(V4(inputs).generate_solutions()) == v1
+
+
+@pytest.mark.parametrize("version", ["v1", "v2", "v3", "v4"])
+def test_solve_with_expired_deadline(version):
+    # the deadline is checked after a few states: solutions with 1 step are all found
+    answer = summle.solve(REFERENCE_INPUT, 5, version, 0)
+    assert not answer.exhausted
+    assert answer.optimal
+    assert answer.solution is not None and answer.solution.num_steps == 1
+
+    answer = summle.solve(REFERENCE_INPUT, 831, version, 0)
+    assert not answer.exhausted and not answer.optimal
+    assert answer.num_solutions == 0
+    assert answer.solution is not None and answer.solution.value != 831
+
+
+@pytest.mark.parametrize("version", ["auto", "v1", "v2", "v3", "v4"])
+def test_solve_returns_soon_after_timeout(version):
+    # best of a few runs, so that a GC pause doesn't fail the test
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        answer = summle.solve(REFERENCE_INPUT, 831, version, 0.05)
+        durations.append(time.perf_counter() - start)
+    assert not answer.exhausted
+    assert min(durations) < 0.05 + 0.015